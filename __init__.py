@@ -35,16 +35,20 @@ bl_info = {
 
 if 'bpy' in locals():
     import imp
+    if 'profiling' in locals():
+        imp.reload(profiling)
     if 'import_collada' in locals():
         imp.reload(import_collada)
     if 'export_collada' in locals():
         imp.reload(export_collada)
 
 import os
+import traceback
 import bpy
 from bpy.props import BoolProperty
 from bpy.props import CollectionProperty
 from bpy.props import EnumProperty
+from bpy.props import IntProperty
 from bpy.props import StringProperty
 from bpy_extras.io_utils import ImportHelper, ExportHelper
 
@@ -80,6 +84,14 @@ class IMPORT_OT_collada(bpy.types.Operator, ImportHelper):
             description="Raytrace transparent materials",
             )
 
+    max_texture_size = IntProperty(
+            default=0,
+            min=0,
+            name="Max texture size",
+            description="Downscale larger textures to this size in pixels, " \
+                    "0 keeps the original size",
+            )
+
     transformation = EnumProperty(
             name="Transformations",
             items=(
@@ -90,6 +102,41 @@ class IMPORT_OT_collada(bpy.types.Operator, ImportHelper):
             default='MUL'
             )
 
+    merge_materials = BoolProperty(
+            default=False,
+            name="Merge materials",
+            description="Share one material between COLLADA materials " \
+                    "with identical effects",
+            )
+
+    low_memory = BoolProperty(
+            default=False,
+            name="Low memory",
+            description="Release COLLADA data as soon as it is imported " \
+                    "and report peak memory usage. Instances of a geometry " \
+                    "are imported together, except with Parent transformation",
+            )
+
+    use_profile = BoolProperty(
+            default=False,
+            name="Profile",
+            description="Report time spent and counts for each import phase",
+            )
+
+    profile_path = StringProperty(
+            default='',
+            name="Profile file",
+            description="Write profile to this JSON file, enables profiling",
+            subtype='FILE_PATH',
+            )
+
+    use_modal = BoolProperty(
+            default=False,
+            name="Background import",
+            description="Import in small steps without blocking the " \
+                    "interface, press Esc to cancel",
+            )
+
     def execute(self, context):
         from . import import_collada
         kwargs = self.as_keywords(ignore=('filter_glob', 'files'))
@@ -97,8 +144,48 @@ class IMPORT_OT_collada(bpy.types.Operator, ImportHelper):
             self.report({'ERROR'}, "COLLADA import failed, not a file " + \
                     kwargs['filepath'])
             return {'CANCELLED'}
+        if self.use_modal:
+            self._import = import_collada.ModalImport(self, context, **kwargs)
+            wm = context.window_manager
+            self._timer = wm.event_timer_add(
+                    import_collada.MODAL_TICK, context.window)
+            wm.progress_begin(0, 100)
+            wm.modal_handler_add(self)
+            return {'RUNNING_MODAL'}
         return import_collada.load(self, context, **kwargs)
 
+    def modal(self, context, event):
+        try:
+            if event.type == 'ESC':
+                return self._modal_end(context, self._import.cancel(context))
+            if event.type == 'TIMER':
+                result = self._import.tick(context)
+                context.window_manager.progress_update(
+                        100 * self._import.progress)
+                if 'RUNNING_MODAL' not in result:
+                    return self._modal_end(context, result)
+        except Exception as ex:
+            traceback.print_exc()
+            self.report({'ERROR'}, "COLLADA import failed, " + str(ex))
+            return self.cancel(context)
+        return {'PASS_THROUGH'}
+
+    def cancel(self, context):
+        """ Removes partly imported data, also when Blender ends the modal
+        import itself, e.g. on loading another file.
+        """
+        try:
+            self._import.cancel(context)
+        except Exception:
+            traceback.print_exc()
+        return self._modal_end(context, {'CANCELLED'})
+
+    def _modal_end(self, context, result):
+        wm = context.window_manager
+        wm.event_timer_remove(self._timer)
+        wm.progress_end()
+        return result
+
     def invoke(self, context, event):
         wm = context.window_manager
         wm.fileselect_add(self)
@@ -148,6 +235,27 @@ class EXPORT_OT_collada(bpy.types.Operator, ExportHelper):
             default=False,
             )
 
+    use_profile = BoolProperty(
+            default=False,
+            name="Profile",
+            description="Report time spent and counts for each export phase",
+            )
+
+    profile_path = StringProperty(
+            default='',
+            name="Profile file",
+            description="Write profile to this JSON file, enables profiling",
+            subtype='FILE_PATH',
+            )
+
+    cache_dir = StringProperty(
+            default='',
+            name="Cache directory",
+            description="Reuse geometries and effects of unchanged meshes " \
+                    "and materials exported before into this directory",
+            subtype='DIR_PATH',
+            )
+
     def execute(self, context):
         from . import export_collada
         kwargs = self.as_keywords(ignore=('filter_glob',))
@@ -0,0 +1,377 @@
+""" Synthetic COLLADA document generator for benchmarks.
+
+Generated documents are fully deterministic, the same options always
+produce byte-identical files, so timings are comparable between runs.
+"""
+
+import math
+import os
+import struct
+import zlib
+
+
+__all__ = ['generate', 'write_png']
+
+COLLADA_NS = 'http://www.collada.org/2005/11/COLLADASchema'
+
+DOCUMENT = """<?xml version="1.0" encoding="utf-8"?>
+<COLLADA xmlns="%(ns)s" version="1.4.1">
+  <asset>
+    <contributor>
+      <authoring_tool>%(tool)s</authoring_tool>
+    </contributor>
+    <unit meter="1.0" name="meter"/>
+    <up_axis>Z_UP</up_axis>
+  </asset>
+  <library_images>
+%(images)s
+  </library_images>
+  <library_effects>
+%(effects)s
+  </library_effects>
+  <library_materials>
+%(materials)s
+  </library_materials>
+  <library_geometries>
+%(geometries)s
+  </library_geometries>
+  <library_nodes>
+%(nodes)s
+  </library_nodes>
+  <library_visual_scenes>
+    <visual_scene id="%(scene)s">
+%(scene_nodes)s
+    </visual_scene>
+  </library_visual_scenes>
+  <scene>
+    <instance_visual_scene url="#%(scene)s"/>
+  </scene>
+</COLLADA>
+"""
+
+IMAGE = """    <image id="image%(i)d">
+      <init_from>%(path)s</init_from>
+    </image>"""
+
+EFFECT = """    <effect id="effect%(i)d">
+      <profile_COMMON>
+%(params)s
+        <technique sid="COMMON">
+          <%(shader)s>
+            <diffuse>
+              %(diffuse)s
+            </diffuse>
+            <shininess>
+              <float>%(shininess).1f</float>
+            </shininess>
+          </%(shader)s>
+        </technique>
+%(extra)s
+      </profile_COMMON>
+    </effect>"""
+
+EFFECT_PARAMS = """        <newparam sid="image%(image)d-surface">
+          <surface type="2D">
+            <init_from>image%(image)d</init_from>
+          </surface>
+        </newparam>
+        <newparam sid="image%(image)d-sampler">
+          <sampler2D>
+            <source>image%(image)d-surface</source>
+          </sampler2D>
+        </newparam>"""
+
+EFFECT_EXTRA = """        <extra>
+          <technique profile="GOOGLEEARTH">
+            <double_sided>1</double_sided>
+          </technique>
+        </extra>"""
+
+MATERIAL = """    <material id="material%(i)d" name="material%(i)d">
+      <instance_effect url="#effect%(effect)d"/>
+    </material>"""
+
+SOURCE = """        <source id="%(id)s">
+          <float_array id="%(id)s-array" count="%(count)d">%(data)s</float_array>
+          <technique_common>
+            <accessor source="#%(id)s-array" count="%(stride_count)d" stride="%(stride)d">
+%(params)s
+            </accessor>
+          </technique_common>
+        </source>"""
+
+PRIMITIVE = """        <%(tag)s count="%(count)d" material="%(symbol)s">
+%(inputs)s
+%(vcount)s          <p>%(p)s</p>
+        </%(tag)s>"""
+
+NODE = """    <node id="%(id)s" name="%(id)s">
+      <translate>%(x).1f 0 0</translate>
+%(children)s
+    </node>"""
+
+INSTANCE_GEOMETRY = """      <instance_geometry url="#geometry%(i)d">
+        <bind_material>
+          <technique_common>
+%(bindings)s
+          </technique_common>
+        </bind_material>
+      </instance_geometry>"""
+
+BINDING = """            <instance_material symbol="%(symbol)s" target="#material%(material)d"/>"""
+
+
+def generate(path,
+        geometries=10,
+        triangles=1000,
+        polylists=0,
+        texcoords=1,
+        materials=4,
+        effects=None,
+        images=0,
+        image_size=64,
+        sketchup=False,
+        depth=0,
+        instances=2):
+    """ Writes synthetic COLLADA document to `path`.
+
+    :param int geometries: number of geometries in the library
+    :param int triangles: triangles per <triangles> primitive of a geometry
+    :param int polylists: quads per <polylist> primitive of a geometry
+    :param int texcoords: number of texcoord sets per primitive
+    :param int materials: number of materials, assigned round-robin
+    :param int effects: number of distinct effect contents, each material
+        gets its own effect id, but materials ``effects`` apart get effects
+        with identical content, defaults to all effects being different
+    :param int images: number of PNG images written next to the document,
+        assigned round-robin to the materials
+    :param int image_size: width and height of the images in pixels
+    :param bool sketchup: add SketchUp authoring tool and GOOGLEEARTH extras
+    :param int depth: depth of the instance_node hierarchy, the geometries
+        are instanced ``instances ** depth`` times
+    :param int instances: instance_node fan-out on each level
+    """
+    basedir = os.path.dirname(os.path.abspath(path))
+    image_xml = []
+    for i in range(images):
+        name = 'bench-image%d.png' % i
+        write_png(os.path.join(basedir, name), image_size, image_size)
+        image_xml.append(IMAGE % {'i': i, 'path': name})
+
+    effects = effects or materials
+    effect_xml = []
+    material_xml = []
+    for i in range(materials):
+        effect_xml.append(_effect(i, i % effects, images, sketchup))
+        material_xml.append(MATERIAL % {'i': i, 'effect': i})
+
+    geometry_xml = [_geometry(i, triangles, polylists, texcoords)
+            for i in range(geometries)]
+    instances_xml = [_instance_geometry(i, triangles, polylists, materials)
+            for i in range(geometries)]
+
+    node_xml = []
+    scene_xml = []
+    if depth:
+        node_xml.append(NODE % {
+            'id': 'level0', 'x': 0,
+            'children': '\n'.join(instances_xml)})
+        for level in range(1, depth):
+            node_xml.append(NODE % {
+                'id': 'level%d' % level, 'x': 0,
+                'children': _instance_nodes('level%d' % (level - 1),
+                    instances)})
+        for j in range(instances):
+            scene_xml.append(NODE % {
+                'id': 'root%d' % j, 'x': j * 10.0,
+                'children': _instance_nodes('level%d' % (depth - 1), 1)})
+    else:
+        scene_xml.append(NODE % {
+            'id': 'root0', 'x': 0,
+            'children': '\n'.join(instances_xml)})
+
+    if sketchup:
+        tool = 'Google SketchUp 8.0.4811'
+    else:
+        tool = 'bpycollada benchmark'
+    with open(path, 'w') as out:
+        out.write(DOCUMENT % {
+            'ns': COLLADA_NS,
+            'tool': tool,
+            'images': '\n'.join(image_xml),
+            'effects': '\n'.join(effect_xml),
+            'materials': '\n'.join(material_xml),
+            'geometries': '\n'.join(geometry_xml),
+            'nodes': '\n'.join(node_xml),
+            'scene': 'scene',
+            'scene_nodes': '\n'.join(scene_xml),
+            })
+    return path
+
+
+def write_png(path, width, height):
+    """ Writes RGBA PNG with a simple deterministic gradient. """
+    rows = []
+    for y in range(height):
+        row = bytearray([0])
+        for x in range(width):
+            row.extend((x * 255 // max(width - 1, 1),
+                        y * 255 // max(height - 1, 1), 128, 255))
+        rows.append(bytes(row))
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + \
+                struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    with open(path, 'wb') as out:
+        out.write(b'\x89PNG\r\n\x1a\n')
+        out.write(chunk(b'IHDR',
+            struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)))
+        out.write(chunk(b'IDAT', zlib.compress(b''.join(rows))))
+        out.write(chunk(b'IEND', b''))
+
+
+def _effect(uid, i, images, sketchup):
+    if images:
+        image = i % images
+        params = EFFECT_PARAMS % {'image': image}
+        diffuse = '<texture texture="image%d-sampler" texcoord="UVSET0"/>' \
+                % image
+    else:
+        params = ''
+        diffuse = '<color>%.3f %.3f %.3f 1</color>' % _color(i)
+    return EFFECT % {
+        'i': uid,
+        'params': params,
+        'shader': ('lambert', 'phong', 'blinn')[i % 3],
+        'diffuse': diffuse,
+        'shininess': 10.0 + i % 20,
+        'extra': sketchup and EFFECT_EXTRA or '',
+        }
+
+
+def _color(i):
+    return ((i * 37 % 256) / 255.0,
+            (i * 91 % 256) / 255.0,
+            (i * 157 % 256) / 255.0)
+
+
+def _grid(faces):
+    """ Wavy grid with at least `faces` quads, vertices and normals. """
+    columns = max(1, int(math.ceil(math.sqrt(faces))))
+    rows = max(1, int(math.ceil(float(faces) / columns)))
+    vertices = []
+    normals = []
+    for y in range(rows + 1):
+        for x in range(columns + 1):
+            z = 0.1 * math.sin(x) * math.cos(y)
+            dx = 0.1 * math.cos(x) * math.cos(y)
+            dy = -0.1 * math.sin(x) * math.sin(y)
+            length = math.sqrt(dx * dx + dy * dy + 1.0)
+            vertices.append((float(x), float(y), z))
+            normals.append((-dx / length, -dy / length, 1.0 / length))
+    quads = []
+    for y in range(rows):
+        for x in range(columns):
+            v = y * (columns + 1) + x
+            quads.append((v, v + 1, v + columns + 2, v + columns + 1))
+    return columns, rows, vertices, normals, quads[:faces]
+
+
+def _source(uid, values, names):
+    stride = len(names)
+    return SOURCE % {
+        'id': uid,
+        'count': len(values) * stride,
+        'data': ' '.join('%.4f' % c for v in values for c in v),
+        'stride_count': len(values),
+        'stride': stride,
+        'params': '\n'.join(
+            '              <param name="%s" type="float"/>' % n
+            for n in names),
+        }
+
+
+def _inputs(gid, texcoords):
+    inputs = ['          <input semantic="VERTEX" source="#%s-vertices" '
+              'offset="0"/>' % gid,
+              '          <input semantic="NORMAL" source="#%s-normals" '
+              'offset="1"/>' % gid]
+    for j in range(texcoords):
+        inputs.append('          <input semantic="TEXCOORD" '
+                      'source="#%s-uv%d" offset="%d" set="%d"/>'
+                      % (gid, j, 2 + j, j))
+    return '\n'.join(inputs)
+
+
+def _indices(polygons, inputs):
+    return ' '.join(str(v) for p in polygons for v in p for _ in range(inputs))
+
+
+def _geometry(i, triangles, polylists, texcoords):
+    gid = 'geometry%d' % i
+    columns, rows, vertices, normals, quads = _grid(
+            int(math.ceil(triangles / 2.0)) + polylists)
+    sources = [_source(gid + '-positions', vertices, 'XYZ'),
+               _source(gid + '-normals', normals, 'XYZ')]
+    for j in range(texcoords):
+        sources.append(_source('%s-uv%d' % (gid, j), [
+            ((j + 1) * v[0] / columns, (j + 1) * v[1] / rows)
+            for v in vertices], 'ST'))
+
+    primitives = []
+    ninputs = 2 + texcoords
+    tris_quads = quads[:int(math.ceil(triangles / 2.0))]
+    if triangles:
+        tris = [t for q in tris_quads
+                for t in ((q[0], q[1], q[2]), (q[0], q[2], q[3]))]
+        tris = tris[:triangles]
+        primitives.append(PRIMITIVE % {
+            'tag': 'triangles',
+            'count': len(tris),
+            'symbol': 'sym0',
+            'inputs': _inputs(gid, texcoords),
+            'vcount': '',
+            'p': _indices(tris, ninputs),
+            })
+    if polylists:
+        polys = quads[len(tris_quads):]
+        primitives.append(PRIMITIVE % {
+            'tag': 'polylist',
+            'count': len(polys),
+            'symbol': 'sym1',
+            'inputs': _inputs(gid, texcoords),
+            'vcount': '          <vcount>%s</vcount>\n'
+                % ' '.join('4' for p in polys),
+            'p': _indices(polys, ninputs),
+            })
+
+    return """    <geometry id="%(id)s" name="%(id)s">
+      <mesh>
+%(sources)s
+        <vertices id="%(id)s-vertices">
+          <input semantic="POSITION" source="#%(id)s-positions"/>
+        </vertices>
+%(primitives)s
+      </mesh>
+    </geometry>""" % {
+            'id': gid,
+            'sources': '\n'.join(sources),
+            'primitives': '\n'.join(primitives),
+            }
+
+
+def _instance_geometry(i, triangles, polylists, materials):
+    bindings = []
+    if triangles:
+        bindings.append(BINDING % {
+            'symbol': 'sym0', 'material': i % materials})
+    if polylists:
+        bindings.append(BINDING % {
+            'symbol': 'sym1', 'material': (i + 1) % materials})
+    return INSTANCE_GEOMETRY % {'i': i, 'bindings': '\n'.join(bindings)}
+
+
+def _instance_nodes(url, count):
+    return '\n'.join('      <instance_node url="#%s"/>' % url
+            for j in range(count))
@@ -0,0 +1,429 @@
+""" Lightweight in-process stand-in for ``bpy``, ``bpy_extras`` and
+``mathutils``, sufficient to run the importer and exporter outside
+Blender.
+
+It keeps Blender data in plain Python objects and counts calls into the
+Blender API in `CALLS`, so benchmarks can compare both time and the
+amount of work done. Only what the add-on uses is implemented, cameras
+and lamps are not.
+"""
+
+import os
+import struct
+import sys
+import types
+from collections import Counter
+
+
+__all__ = ['install', 'reset', 'CALLS', 'context']
+
+CALLS = Counter()
+
+
+class Matrix(object):
+    __slots__ = ('rows',)
+
+    def __init__(self, rows=None):
+        if rows is None:
+            rows = [[float(i == j) for j in range(4)] for i in range(4)]
+        self.rows = [[float(c) for c in row] for row in rows]
+
+    @classmethod
+    def Translation(cls, vector):
+        m = cls()
+        for i, c in enumerate(vector):
+            m.rows[i][3] = float(c)
+        return m
+
+    def transposed(self):
+        return Matrix(zip(*self.rows))
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class Vector(tuple):
+    def __new__(cls, seq=(0.0, 0.0, 0.0)):
+        return tuple.__new__(cls, (float(c) for c in seq))
+
+    def dot(self, other):
+        return sum(a * b for a, b in zip(self, other))
+
+
+class Collection(object):
+    """ bpy.data collection keyed by unique names. """
+    def __init__(self, factory):
+        self._factory = factory
+        self._items = {}
+        self._suffix = Counter()
+
+    def new(self, name, *args, **kwargs):
+        CALLS['data.new'] += 1
+        base = name[:63]
+        while name in self._items or len(name) > 63:
+            self._suffix[base] += 1
+            name = '%s.%.3d' % (base[:59], self._suffix[base])
+        item = self._factory(name, *args, **kwargs)
+        self._items[name] = item
+        return item
+
+    def remove(self, item):
+        CALLS['data.remove'] += 1
+        del self._items[item.name]
+
+    def __contains__(self, name):
+        return name in self._items
+
+    def __getitem__(self, name):
+        return self._items[name]
+
+    def __iter__(self):
+        return iter(self._items.values())
+
+    def __len__(self):
+        return len(self._items)
+
+
+class ID(object):
+    """ Datablock accepting any attribute, with custom properties. """
+    def __init__(self, name):
+        self.name = name
+        self._props = {}
+
+    def __setitem__(self, key, value):
+        self._props[key] = value
+
+    def __getitem__(self, key):
+        return self._props[key]
+
+
+class Namespace(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class Vertex(object):
+    __slots__ = ('co', 'normal')
+
+    def __init__(self):
+        self.co = (0.0, 0.0, 0.0)
+        self.normal = (0.0, 0.0, 1.0)
+
+
+class Face(object):
+    __slots__ = ('mesh', 'vertices_raw', 'use_smooth')
+
+    def __init__(self, mesh):
+        self.mesh = mesh
+        self.vertices_raw = (0, 0, 0, 0)
+        self.use_smooth = False
+
+    @property
+    def vertices(self):
+        if self.vertices_raw[3] == 0:
+            return self.vertices_raw[:3]
+        return self.vertices_raw
+
+    @property
+    def normal(self):
+        co = [self.mesh.vertices[v].co for v in self.vertices[:3]]
+        a = [co[1][i] - co[0][i] for i in range(3)]
+        b = [co[2][i] - co[0][i] for i in range(3)]
+        n = (a[1] * b[2] - a[2] * b[1],
+             a[2] * b[0] - a[0] * b[2],
+             a[0] * b[1] - a[1] * b[0])
+        length = sum(c * c for c in n) ** 0.5 or 1.0
+        return tuple(c / length for c in n)
+
+
+class Elements(list):
+    def __init__(self, factory):
+        list.__init__(self)
+        self._factory = factory
+
+    def add(self, count):
+        CALLS['elements.add'] += 1
+        self.extend(self._factory() for i in range(count))
+
+    def foreach_get(self, attr, seq):
+        CALLS['foreach_get'] += 1
+        values = []
+        for e in self:
+            value = getattr(e, attr)
+            if hasattr(value, '__len__'):
+                values.extend(value)
+            else:
+                values.append(value)
+        seq[:] = values
+
+    def foreach_set(self, attr, seq):
+        CALLS['foreach_set'] += 1
+        if attr == 'vertices_raw':
+            for i, f in enumerate(self):
+                f.vertices_raw = tuple(seq[i * 4:i * 4 + 4])
+        else:
+            size = len(seq) // max(len(self), 1)
+            for i, e in enumerate(self):
+                setattr(e, attr, tuple(seq[i * size:i * size + size]))
+
+
+class UVFace(object):
+    __slots__ = ('uv1', 'uv2', 'uv3', 'uv4')
+
+
+class UVLayers(list):
+    def __init__(self, mesh):
+        list.__init__(self)
+        self._mesh = mesh
+
+    def new(self):
+        CALLS['uv_textures.new'] += 1
+        layer = Namespace(data=[UVFace() for f in self._mesh.tessfaces])
+        self.append(layer)
+        return layer
+
+
+class Mesh(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.vertices = Elements(Vertex)
+        self.tessfaces = Elements(lambda: Face(self))
+        self.uv_textures = UVLayers(self)
+        self.tessface_uv_textures = self.uv_textures
+
+    @property
+    def faces(self):
+        return self.tessfaces
+
+    def update(self):
+        CALLS['mesh.update'] += 1
+
+
+class TextureSlots(list):
+    def add(self):
+        CALLS['texture_slots.add'] += 1
+        slot = Namespace(texture=None, texture_coords='ORCO',
+                use_map_color_diffuse=False, use_map_alpha=False)
+        self.append(slot)
+        return slot
+
+
+class Material(ID):
+    def __init__(self, name):
+        ID.__init__(self, name)
+        self.diffuse_shader = 'LAMBERT'
+        self.specular_shader = 'COOKTORR'
+        self.diffuse_color = (0.8, 0.8, 0.8)
+        self.diffuse_intensity = 0.8
+        self.specular_color = (1.0, 1.0, 1.0)
+        self.specular_intensity = 0.5
+        self.specular_hardness = 50
+        self.ambient = 1.0
+        self.emit = 0.0
+        self.alpha = 1.0
+        self.use_shadeless = False
+        self.use_transparency = False
+        self.use_transparent_shadows = False
+        self.transparency_method = 'MASK'
+        self.mirror_color = (1.0, 1.0, 1.0)
+        self.raytrace_mirror = Namespace(use=False, reflect_factor=0.0)
+        self.raytrace_transparency = Namespace(ior=1.0, depth=2)
+        self.texture_slots = TextureSlots()
+
+
+class Texture(ID):
+    def __init__(self, name, type='IMAGE'):
+        ID.__init__(self, name)
+        self.type = type
+        self.image = None
+
+
+class Image(ID):
+    def __init__(self, name, width=0, height=0):
+        ID.__init__(self, name)
+        self.size = [width, height]
+        self.depth = 32
+        self.filepath = ''
+        self.packed = False
+        self.use_alpha = False
+
+    def pack(self, as_png=False):
+        CALLS['image.pack'] += 1
+        self.packed = True
+
+    def scale(self, width, height):
+        CALLS['image.scale'] += 1
+        self.size = [width, height]
+
+
+class MaterialSlot(object):
+    __slots__ = ('link', 'material')
+
+    def __init__(self):
+        self.link = 'DATA'
+        self.material = None
+
+
+class Object(ID):
+    def __init__(self, name, data):
+        ID.__init__(self, name)
+        self.data = data
+        if isinstance(data, Mesh):
+            self.type = 'MESH'
+        elif data is None:
+            self.type = 'EMPTY'
+        else:
+            self.type = 'CAMERA'
+        self.matrix_world = Matrix()
+        self.matrix_local = Matrix()
+        self.material_slots = []
+        self.active_material = None
+        self.dupli_type = 'NONE'
+        self.dupli_group = None
+        self.children = []
+        self._parent = None
+
+    @property
+    def parent(self):
+        return self._parent
+
+    @parent.setter
+    def parent(self, parent):
+        if self._parent is not None:
+            self._parent.children.remove(self)
+        self._parent = parent
+        if parent is not None:
+            parent.children.append(self)
+
+
+class SceneObjects(list):
+    active = None
+
+    def link(self, obj):
+        CALLS['objects.link'] += 1
+        self.append(obj)
+
+    def unlink(self, obj):
+        CALLS['objects.unlink'] += 1
+        self.remove(obj)
+
+    def __contains__(self, name):
+        return any(obj.name == name for obj in self)
+
+
+class Operator(object):
+    """ Records every call of ``bpy.ops.<module>.<name>``. """
+    def __init__(self, module, name):
+        self._id = '%s.%s' % (module, name)
+        self._impl = _OPERATORS.get(self._id)
+
+    def __call__(self, *args, **kwargs):
+        CALLS['ops.' + self._id] += 1
+        if self._impl:
+            self._impl(*args, **kwargs)
+        return {'FINISHED'}
+
+
+class OperatorModule(object):
+    def __init__(self, module):
+        self._module = module
+
+    def __getattr__(self, name):
+        return Operator(self._module, name)
+
+
+class BPyOpsSubModOp(object):
+    @staticmethod
+    def _scene_update(ctx):
+        CALLS['scene_update'] += 1
+
+
+class Report(object):
+    """ Operator stand-in collecting reports. """
+    def __init__(self):
+        self.reports = []
+
+    def report(self, kind, message):
+        self.reports.append((kind, message))
+
+
+def _material_slot_add():
+    context.scene.objects.active.material_slots.append(MaterialSlot())
+
+_OPERATORS = {
+    'object.material_slot_add': _material_slot_add,
+    }
+
+
+def load_image(path):
+    """ Reads just the PNG header, pixels are never decoded. """
+    CALLS['load_image'] += 1
+    with open(path, 'rb') as f:
+        header = f.read(26)
+    if header[:8] != b'\x89PNG\r\n\x1a\n':
+        return None
+    width, height = struct.unpack('>II', header[16:24])
+    image = data.images.new(os.path.basename(path), width, height)
+    image.filepath = path
+    image.depth = header[25] == 6 and 32 or 24
+    return image
+
+
+data = None
+context = None
+
+
+def reset():
+    """ Forgets all Blender data and recorded calls. """
+    global data, context
+    CALLS.clear()
+    data = Namespace(
+        meshes=Collection(Mesh),
+        cameras=Collection(ID),
+        lamps=Collection(ID),
+        objects=Collection(Object),
+        materials=Collection(Material),
+        textures=Collection(Texture),
+        images=Collection(Image),
+        )
+    context = Namespace(
+        scene=Namespace(objects=SceneObjects()),
+        object=None,
+        )
+    bpy = sys.modules.get('bpy')
+    if bpy is not None:
+        bpy.data = data
+        bpy.context = context
+
+
+def install():
+    """ Registers stand-in modules in `sys.modules`. """
+    bpy = types.ModuleType('bpy')
+    ops = types.ModuleType('bpy.ops')
+    ops.BPyOpsSubModOp = BPyOpsSubModOp
+    ops.__getattr__ = OperatorModule
+    bpy.ops = ops
+    bpy.path = types.ModuleType('bpy.path')
+    bpy.path.abspath = lambda path: path
+
+    bpy_extras = types.ModuleType('bpy_extras')
+    image_utils = types.ModuleType('bpy_extras.image_utils')
+    image_utils.load_image = load_image
+    bpy_extras.image_utils = image_utils
+
+    mathutils = types.ModuleType('mathutils')
+    mathutils.Matrix = Matrix
+    mathutils.Vector = Vector
+
+    sys.modules.update({
+        'bpy': bpy,
+        'bpy.ops': ops,
+        'bpy.path': bpy.path,
+        'bpy_extras': bpy_extras,
+        'bpy_extras.image_utils': image_utils,
+        'mathutils': mathutils,
+        })
+    reset()
@@ -0,0 +1,168 @@
+""" Times ColladaImport and ColladaExport on synthetic documents outside
+Blender, using the `fakebpy` stand-in.
+
+    python benchmarks/run.py [--repeat N] [--scenario NAME] [--json FILE]
+
+Every scenario is imported, with its import options, and then the imported scene is exported
+again. The best of the repeated runs is reported together with the
+per-phase profile and the number of Blender API calls, which do not
+change between runs. Low memory scenarios also check that geometry
+arrays are freed during the import.
+"""
+
+import argparse
+import gc
+import importlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+import weakref
+
+import daegen
+import fakebpy
+
+
+PACKAGE = 'bpycollada'
+
+SCENARIOS = [
+    ('triangles', dict(geometries=20, triangles=5000), {}),
+    ('polylists', dict(geometries=20, triangles=0, polylists=2500), {}),
+    ('texcoords', dict(geometries=20, triangles=2000, texcoords=3), {}),
+    ('materials', dict(geometries=200, triangles=50, materials=200), {}),
+    ('duplicates', dict(geometries=200, triangles=50, materials=200,
+                        effects=5), dict(merge_materials=True)),
+    ('textures', dict(geometries=20, triangles=500, materials=20,
+                      images=10, image_size=256), {}),
+    ('sketchup', dict(geometries=50, triangles=500, polylists=250,
+                      materials=50, images=10, sketchup=True), {}),
+    ('instances', dict(geometries=5, triangles=1000, depth=5), {}),
+    ('hierarchy', dict(geometries=5, triangles=1000, depth=5),
+                  dict(transformation='PARENT')),
+    ('lowmemory', dict(geometries=20, triangles=2000, depth=3),
+                  dict(low_memory=True)),
+]
+
+
+def load_addon():
+    """ Imports add-on modules as a package without running its
+    ``__init__``, which needs the full Blender operator API.
+    """
+    fakebpy.install()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    package = types.ModuleType(PACKAGE)
+    package.__path__ = [root]
+    sys.modules[PACKAGE] = package
+    return (importlib.import_module(PACKAGE + '.import_collada'),
+            importlib.import_module(PACKAGE + '.export_collada'))
+
+
+def run_once(import_collada, export_collada, path, outdir, cache_dir='',
+        **options):
+    fakebpy.reset()
+    gc.collect()
+    op = fakebpy.Report()
+    kwargs = dict(transformation='MUL', use_profile=True)
+    kwargs.update(options)
+    start = time.perf_counter()
+    import_collada.load(op, fakebpy.context, filepath=path, **kwargs)
+    imported = time.perf_counter()
+    export_collada.save(op, fakebpy.context,
+            filepath=os.path.join(outdir, 'export.dae'),
+            directory=outdir, export_as='dae_only', use_profile=True,
+            cache_dir=cache_dir)
+    exported = time.perf_counter()
+    return {
+        'import': imported - start,
+        'export': exported - imported,
+        'calls': dict(fakebpy.CALLS),
+        'reports': [message for kind, message in op.reports],
+        }
+
+
+def check_release(import_collada, path, **options):
+    """ Checks that low memory import frees the arrays of each geometry
+    while importing, as soon as its last instance is built. Returns the
+    number of geometries freed before the last import step.
+    """
+    fakebpy.reset()
+    kwargs = dict(transformation='MUL')
+    kwargs.update(options)
+    c = import_collada.Collada(path, ignore=[import_collada.DaeBrokenRefError])
+    arrays = dict((id(geom), [weakref.ref(data)
+            for prim in geom.primitives
+            for data in [prim.index] + [input[4].data
+                for inputs in prim.sources.values() for input in inputs]])
+        for geom in c.geometries)
+    imp = import_collada.importer(fakebpy.context, c, path,
+            import_collada.Profile(False), **kwargs)
+    freed = set()
+    steps = import_collada.build(imp, c, import_collada.Profile(False), [],
+            **kwargs)
+    for progress in steps:
+        if progress >= 1.0:
+            break
+        for key, refs in arrays.items():
+            if all(ref() is None for ref in refs):
+                freed.add(key)
+            elif key not in imp._uses:
+                raise AssertionError('geometry arrays not freed after '
+                        'its last instance')
+    for progress in steps:
+        pass
+    return len(freed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scenario', action='append',
+            choices=[scenario[0] for scenario in SCENARIOS])
+    parser.add_argument('--json', help="write results to this file")
+    parser.add_argument('--cache', action='store_true',
+            help="export with fragment cache, warm after the first repeat")
+    args = parser.parse_args(argv)
+
+    import_collada, export_collada = load_addon()
+    tmpdir = tempfile.mkdtemp(prefix='bpycollada-bench-')
+    results = {}
+    try:
+        for name, generate, options in SCENARIOS:
+            if args.scenario and name not in args.scenario:
+                continue
+            path = daegen.generate(os.path.join(tmpdir, name + '.dae'),
+                    **generate)
+            cache_dir = ''
+            if args.cache:
+                cache_dir = os.path.join(tmpdir, name + '-cache')
+            runs = [run_once(import_collada, export_collada, path, tmpdir,
+                             cache_dir, **options)
+                    for i in range(args.repeat)]
+            best = {
+                'import': min(r['import'] for r in runs),
+                'export': min(r['export'] for r in runs),
+                'calls': runs[-1]['calls'],
+                'reports': runs[-1]['reports'],
+                }
+            results[name] = best
+            print('%-10s import %8.3fs  export %8.3fs  %d API calls' % (
+                name, best['import'], best['export'],
+                sum(best['calls'].values())))
+            for message in best['reports']:
+                print('    ' + message)
+            if options.get('low_memory'):
+                print('    %d geometries freed during import' %
+                        check_release(import_collada, path, **options))
+    finally:
+        shutil.rmtree(tmpdir)
+
+    if args.json:
+        with open(args.json, 'w') as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,25 @@
+import hashlib
+import os
+from collections import Counter
+
 import bpy
 import numpy as np
 from mathutils import Matrix, Vector
 
 from collada import Collada
-from collada.common import tag
+from collada.common import DaeObject, tag
 from collada.geometry import Geometry
 from collada.material import Effect, Material
-from collada.scene import Node, Scene
+from collada.scene import Node, NodeNode, Scene
 from collada.scene import GeometryNode, MaterialNode
-from collada.scene import MatrixTransform
+from collada.scene import MatrixTransform, TranslateTransform
 from collada.source import FloatSource, InputList
+from collada.xmlutil import etree
+
+from .profiling import Profile
+
+
+CACHE_VERSION = 1
 
 
 def save(op, context,
@@ -18,22 +28,42 @@ def save(op, context,
         export_as=None,
         **kwargs):
 
-    ex = ColladaExport(directory, export_as)
+    prof = Profile.from_options(**kwargs)
+    cache = None
+    if kwargs.get('cache_dir'):
+        cache = FragmentCache(bpy.path.abspath(kwargs['cache_dir']),
+                export_as=export_as, axis_up=kwargs.get('axis_up'))
+    ex = ColladaExport(directory, export_as, profile=prof, cache=cache)
 
-    for o in context.scene.objects:
-        ex.object(o)
+    with prof.phase('geometry'):
+        ex.count_instances(context.scene.objects)
+        for o in context.scene.objects:
+            if o.parent is None:
+                ex.object(o)
 
-    ex.save(filepath)
+    with prof.phase('serialization'):
+        ex.save(filepath)
+
+    prof.report(op, "COLLADA export")
+    if kwargs.get('profile_path'):
+        prof.write(bpy.path.abspath(kwargs['profile_path']))
 
     return {'FINISHED'}
 
 
 class ColladaExport(object):
-    def __init__(self, directory, export_as='dae_only'):
+    def __init__(self, directory, export_as='dae_only', profile=None,
+            cache=None):
         self._dir = directory
         self._export_as = export_as
+        self._profile = profile or Profile(False)
+        self._cache = cache
         self._geometries = {}
         self._materials = {}
+        self._groups = {}
+        self._hierarchies = {}
+        self._instances = Counter()
+        self._keys = {}
         self._collada = Collada()
 
         self._scene = Scene('main', [])
@@ -43,16 +73,19 @@ class ColladaExport(object):
     def save(self, fp):
         self._collada.write(fp)
 
-    def object(self, b_obj, parent=None, children=True):
+    def object(self, b_obj, parent=None, children=True, world=False):
         b_matrix = b_obj.matrix_world
-        if parent:
+        if parent and not world:
             if children:
                 b_matrix = b_obj.matrix_local
             else:
                 b_matrix = Matrix()
 
         node = self.node(b_obj.name, b_matrix)
-        if any(b_obj.children) and children:
+        shared = children and self._shared(b_obj)
+        if shared:
+            node.children.append(NodeNode(self.hierarchy(b_obj)))
+        elif any(b_obj.children) and children:
             self.object(b_obj, parent=node, children=False)
             for child in b_obj.children:
                 self.object(child, parent=node)
@@ -62,9 +95,55 @@ class ColladaExport(object):
         else:
             self._scene.nodes.append(node)
 
+        if shared:
+            self._profile.count('geometry', instances=1)
+            return
+
+        b_group = _dupli_group(b_obj)
+        if b_group:
+            node.children.append(NodeNode(self.group(b_group)))
+
         inode_meth = getattr(self, 'obj_' + b_obj.type, None)
         if inode_meth:
             node.children.extend(inode_meth(b_obj))
+        self._profile.count('geometry', objects=1)
+
+    def count_instances(self, b_objs):
+        """ Counts identical object hierarchies, those appearing more than
+        once are exported just once into library_nodes.
+        """
+        for b_obj in b_objs:
+            if any(b_obj.children):
+                self._instances[self._hierarchy_key(b_obj)] += 1
+
+    def hierarchy(self, b_obj):
+        """ Library node with the contents and children of the object,
+        shared by all objects with identical hierarchy.
+        """
+        key = self._hierarchy_key(b_obj)
+        if key not in self._hierarchies:
+            node = Node(b_obj.name + '-node')
+            self.object(b_obj, parent=node, children=False)
+            for child in b_obj.children:
+                self.object(child, parent=node)
+            self._collada.nodes.append(node)
+            self._hierarchies[key] = node
+        return self._hierarchies[key]
+
+    def group(self, b_group):
+        """ Library node with the group objects. """
+        if b_group.name not in self._groups:
+            offset = b_group.dupli_offset
+            node = Node(b_group.name + '-group', transforms=[
+                TranslateTransform(-offset[0], -offset[1], -offset[2])])
+            self._groups[b_group.name] = node
+            for b_obj in b_group.objects:
+                if b_obj.parent is None or \
+                        b_obj.parent.name not in b_group.objects:
+                    # group roots are placed in world space
+                    self.object(b_obj, parent=node, world=True)
+            self._collada.nodes.append(node)
+        return self._groups[b_group.name]
 
     def node(self, b_name, b_matrix=None):
         tf = []
@@ -83,12 +162,25 @@ class ColladaExport(object):
         for slot in b_obj.material_slots:
             sname = slot.material.name
             if sname not in self._materials:
-                self._materials[sname] = self.material(slot.material)
+                with self._profile.phase('materials'):
+                    self._materials[sname] = self.material(slot.material)
+                self._profile.count('materials', materials=1)
             matnodes.append(MaterialNode('none', self._materials[sname],
                 inputs=[]))
         return [GeometryNode(geom, matnodes)]
 
     def mesh(self, b_mesh):
+        key = None
+        if self._cache:
+            key = self._cache.key('geometry', b_mesh.name,
+                    *_mesh_arrays(b_mesh))
+            xmlnode = self._cache.get(key)
+            if xmlnode is not None:
+                geom = Fragment(b_mesh.name + '-geom', xmlnode)
+                self._collada.geometries.append(geom)
+                self._profile.count('geometry', cached=1)
+                return geom
+
         vert_srcid = b_mesh.name + '-vertary'
         vert_f = [c for v in b_mesh.vertices for c in v.co]
         vert_src = FloatSource(vert_srcid, np.array(vert_f), ('X', 'Y', 'Z'))
@@ -144,6 +236,11 @@ class ColladaExport(object):
             geom.primitives.append(p)
 
         self._collada.geometries.append(geom)
+        self._profile.count('geometry',
+                vertices=len(b_mesh.vertices), faces=len(b_mesh.faces))
+        if key:
+            geom.save()
+            self._cache.put(key, geom.xmlnode)
         return geom
 
     def material(self, b_mat):
@@ -169,21 +266,121 @@ class ColladaExport(object):
                 'reflective': tuple(b_mat.mirror_color),
                 'reflectivity': b_mat.raytrace_mirror.reflect_factor,
                 })
-        effect = Effect(b_mat.name + '-fx', [], shader, **child)
+        fxid = b_mat.name + '-fx'
+        effect = None
+        key = None
+        if self._cache:
+            key = self._cache.key('effect', fxid, shader,
+                    sorted(child.items()))
+            xmlnode = self._cache.get(key)
+            if xmlnode is not None:
+                effect = Fragment(fxid, xmlnode)
+                self._profile.count('materials', cached=1)
+        if effect is None:
+            effect = Effect(fxid, [], shader, **child)
+            if key:
+                effect.save()
+                self._cache.put(key, effect.xmlnode)
         mat = Material(b_mat.name, b_mat.name, effect)
         self._collada.effects.append(effect)
         self._collada.materials.append(mat)
         return mat
 
+    def _shared(self, b_obj):
+        return any(b_obj.children) and \
+                self._instances[self._hierarchy_key(b_obj)] > 1
+
+    def _hierarchy_key(self, b_obj):
+        key = self._keys.get(b_obj.name)
+        if key is None:
+            b_group = _dupli_group(b_obj)
+            key = (
+                b_obj.type,
+                b_obj.data and b_obj.data.name,
+                tuple(s.material and s.material.name
+                    for s in b_obj.material_slots),
+                b_group and b_group.name,
+                tuple((self._hierarchy_key(c), _matrix_key(c.matrix_local))
+                    for c in b_obj.children),
+                )
+            self._keys[b_obj.name] = key
+        return key
+
     def matrix(self, b_matrix):
         f = tuple(map(tuple, b_matrix.transposed()))
         return MatrixTransform(np.array(
             [e for r in f for e in r], dtype=np.float32))
 
 
+class Fragment(DaeObject):
+    """ Library element from the export cache, written out verbatim. """
+    def __init__(self, id, xmlnode):
+        self.id = id
+        self.xmlnode = xmlnode
+
+    def save(self):
+        pass
+
+
+class FragmentCache(object):
+    """ Serialized <geometry> and <effect> elements stored on disk, keyed
+    by the Blender data they were created from and the export options.
+    """
+    def __init__(self, directory, **options):
+        self._dir = directory
+        self._options = repr((CACHE_VERSION, sorted(options.items())))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, *parts):
+        digest = hashlib.sha1(self._options.encode('utf-8'))
+        for part in parts:
+            if hasattr(part, 'tobytes'):
+                digest.update(part.tobytes())
+            else:
+                digest.update(repr(part).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return None
+        with open(path, 'rb') as f:
+            return etree.fromstring(f.read())
+
+    def put(self, key, xmlnode):
+        path = self._path(key)
+        tmp = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp, 'wb') as f:
+            f.write(etree.tostring(xmlnode))
+        if os.path.exists(path):
+            os.remove(tmp)
+        else:
+            os.rename(tmp, path)
+
+    def _path(self, key):
+        return os.path.join(self._dir, key + '.xml')
+
+
+def _mesh_arrays(b_mesh):
+    co = np.empty(len(b_mesh.vertices) * 3, dtype=np.float32)
+    b_mesh.vertices.foreach_get('co', co)
+    faces = np.empty(len(b_mesh.faces) * 4, dtype=np.int32)
+    b_mesh.faces.foreach_get('vertices_raw', faces)
+    smooth = np.empty(len(b_mesh.faces), dtype=np.bool_)
+    b_mesh.faces.foreach_get('use_smooth', smooth)
+    return co, faces, smooth
+
 def _is_trimesh(faces):
     return all([len(f.vertices) == 3 for f in faces])
 
+def _dupli_group(b_obj):
+    if b_obj.dupli_type == 'GROUP':
+        return b_obj.dupli_group
+
+def _matrix_key(b_matrix):
+    return tuple(round(e, 6) for r in b_matrix for e in r)
+
 def _url(uid):
     return '#' + uid
 
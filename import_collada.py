@@ -1,8 +1,21 @@
 import os
+import sys
 import math
+import threading
+from collections import Counter, OrderedDict
 from tempfile import NamedTemporaryFile
 from contextlib import contextmanager
 
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
 import bpy
 from bpy.ops import BPyOpsSubModOp
 from bpy_extras.image_utils import load_image
@@ -10,14 +23,16 @@ from mathutils import Matrix, Vector
 
 from collada import Collada
 from collada.camera import PerspectiveCamera, OrthographicCamera
-from collada.common import DaeBrokenRefError
+from collada.common import DaeBrokenRefError, tag
 from collada.light import AmbientLight, DirectionalLight, PointLight, SpotLight
-from collada.material import Map
+from collada.material import Effect, Map
 from collada.polylist import Polylist, BoundPolylist
 from collada.primitive import BoundPrimitive
 from collada.scene import Scene, Node, NodeNode, GeometryNode
 from collada.triangleset import TriangleSet, BoundTriangleSet
 
+from .profiling import Profile, clock
+
 
 __all__ = ['load']
 
@@ -26,43 +41,168 @@ COLLADA_NS      = 'http://www.collada.org/2005/11/COLLADASchema'
 DAE_NS          = {'dae': COLLADA_NS}
 TRANSPARENCY_RAY_DEPTH = 8
 MAX_NAME_LENGTH        = 27
+MODAL_TICK             = 0.05
+MODAL_BUDGET           = 0.1
+# removal order matters, users go before used datablocks
+DATABLOCKS = ('objects', 'meshes', 'cameras', 'lamps',
+              'materials', 'textures', 'images')
 
 
 def load(op, ctx, filepath=None, **kwargs):
-    c = Collada(filepath, ignore=[DaeBrokenRefError])
-    impclass = get_import(c)
-    imp = impclass(ctx, c, os.path.dirname(filepath), **kwargs)
+    prof = Profile.from_options(**kwargs)
+    memory = [_memory('start')]
+    with prof.phase('parse'):
+        c = Collada(filepath, ignore=[DaeBrokenRefError])
+    memory.append(_memory('parse'))
+    imp = importer(ctx, c, filepath, prof, **kwargs)
+
+    with prevented_updates(ctx, prof):
+        for progress in build(imp, c, prof, memory, **kwargs):
+            pass
+
+    report(op, prof, memory, **kwargs)
+    return {'FINISHED'}
 
+def importer(ctx, collada, filepath, prof, **kwargs):
+    with prof.phase('vendor detection'):
+        impclass = get_import(collada)
+    return impclass(ctx, collada, os.path.dirname(filepath),
+            profile=prof, **kwargs)
+
+def build(imp, c, prof, memory, **kwargs):
+    """ Creates Blender data step by step, yielding import progress
+        between 0 and 1 after each geometry, node, light and camera. """
     tf = kwargs['transformation']
 
-    with prevented_updates(ctx):
-        if tf in ('MUL', 'APPLY'):
-            for i, obj in enumerate(c.scene.objects('geometry')):
+    if tf in ('MUL', 'APPLY'):
+        geometries = list(c.scene.objects('geometry'))
+        steps = len(geometries)
+        if kwargs.get('low_memory', False):
+            geometries = _grouped(geometries)
+    elif tf == 'PARENT':
+        steps = sum(1 for step in _dfs(c.scene, lambda node, parent: None))
+    lights = list(c.scene.objects('light'))
+    cameras = list(c.scene.objects('camera'))
+    steps = float(max(1, steps + len(lights) + len(cameras)))
+    done = 0
+
+    if tf in ('MUL', 'APPLY'):
+        for i, obj in enumerate(geometries):
+            with prof.phase('geometry'):
                 b_geoms = imp.geometry(obj)
                 if tf == 'MUL':
                     tf_mat = Matrix(obj.matrix)
                     for b_obj in b_geoms:
                         b_obj.matrix_world = tf_mat
-        elif tf == 'PARENT':
-            _dfs(c.scene, imp.node)
-
-        for i, obj in enumerate(c.scene.objects('light')):
-            imp.light(obj, i)
-
-        for obj in c.scene.objects('camera'):
-            imp.camera(obj)
-
-    return {'FINISHED'}
+            done += 1
+            yield done / steps
+    elif tf == 'PARENT':
+        def node(node, parent):
+            with prof.phase('geometry'):
+                return imp.node(node, parent)
+        for step in _dfs(c.scene, node):
+            done += 1
+            yield done / steps
+    memory.append(_memory('geometry'))
+
+    for i, obj in enumerate(lights):
+        imp.light(obj, i)
+        done += 1
+        yield done / steps
+
+    for obj in cameras:
+        imp.camera(obj)
+        done += 1
+        yield done / steps
+    memory.append(_memory('lights and cameras'))
+
+def report(op, prof, memory, **kwargs):
+    if kwargs.get('low_memory', False) and memory:
+        start, current, peak = memory[0]
+        phases = ['%s %s (peak +%s)' % (
+            phase, _mb(rss), _mb(_increase(top, peak)))
+            for phase, rss, top in memory[1:]]
+        op.report({'INFO'}, "COLLADA import memory, %s at start: %s" % (
+            _mb(current), ", ".join(phases)))
+    prof.report(op, "COLLADA import")
+    if kwargs.get('profile_path'):
+        prof.write(bpy.path.abspath(kwargs['profile_path']))
 
 @contextmanager
-def prevented_updates(ctx):
+def prevented_updates(ctx, profile=None):
     """ Stop Blender from funning scene update for each change. Update it
-        just once the import is finished. """
+        just once the import is finished. Scene updates are restored even
+        if the import fails. """
+    profile = profile or Profile(False)
     scene_update = BPyOpsSubModOp._scene_update
     setattr(BPyOpsSubModOp, '_scene_update', lambda ctx: None)
-    yield
-    setattr(BPyOpsSubModOp, '_scene_update', scene_update)
-    BPyOpsSubModOp._scene_update(ctx)
+    try:
+        yield
+    finally:
+        setattr(BPyOpsSubModOp, '_scene_update', scene_update)
+    with profile.phase('scene update'):
+        BPyOpsSubModOp._scene_update(ctx)
+
+class ModalImport(object):
+    """ Import driven by a modal operator timer. COLLADA document is parsed
+    in a background thread, Blender data is then built in steps taking
+    about `MODAL_BUDGET` seconds per timer tick.
+    """
+    def __init__(self, op, ctx, filepath=None, **kwargs):
+        self.progress = 0.0
+        self._op = op
+        self._filepath = filepath
+        self._kwargs = kwargs
+        self._prof = Profile.from_options(**kwargs)
+        self._memory = [_memory('start')]
+        self._collada = None
+        self._error = None
+        self._imp = None
+        self._steps = None
+        self._thread = threading.Thread(target=self._parse)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def tick(self, ctx):
+        """ Runs next import steps, returns operator result. """
+        if self._thread.is_alive():
+            return {'RUNNING_MODAL'}
+        if self._error is not None:
+            self._op.report({'ERROR'}, "COLLADA import failed, " + \
+                    str(self._error))
+            return {'CANCELLED'}
+        if self._steps is None:
+            self._memory.append(_memory('parse'))
+            self._imp = importer(ctx, self._collada, self._filepath,
+                    self._prof, **self._kwargs)
+            self._steps = build(self._imp, self._collada, self._prof,
+                    self._memory, **self._kwargs)
+        self._imp._ctx = ctx
+        deadline = clock() + MODAL_BUDGET
+        with prevented_updates(ctx, self._prof):
+            for self.progress in self._steps:
+                if clock() >= deadline:
+                    return {'RUNNING_MODAL'}
+        report(self._op, self._prof, self._memory, **self._kwargs)
+        return {'FINISHED'}
+
+    def cancel(self, ctx):
+        """ Removes datablocks created by the import so far, anything
+        created meanwhile by the user is left alone.
+        """
+        self._steps = None
+        if self._imp is not None:
+            self._imp.remove_created(ctx)
+        self._op.report({'INFO'}, "COLLADA import cancelled")
+        return {'CANCELLED'}
+
+    def _parse(self):
+        try:
+            with self._prof.phase('parse'):
+                self._collada = Collada(self._filepath,
+                        ignore=[DaeBrokenRefError])
+        except Exception as ex:
+            self._error = ex
 
 def get_import(collada):
     for i in VENDOR_SPECIFIC:
@@ -73,17 +213,27 @@ def get_import(collada):
 
 class ColladaImport(object):
     """ Standard COLLADA importer. """
-    def __init__(self, ctx, collada, basedir, **kwargs):
+    def __init__(self, ctx, collada, basedir, profile=None, **kwargs):
         self._ctx = ctx
         self._collada = collada
+        self._basedir = basedir
         self._kwargs = kwargs
+        self._profile = profile or Profile(False)
         self._images = {}
+        self._packed = {}
+        self._merged = {}
+        self._created = []
         self._namecount = 0
         self._names = {}
+        self._uses = Counter()
+        if kwargs.get('low_memory', False):
+            for bgeom in collada.scene.objects('geometry'):
+                self._uses[id(bgeom.original)] += 1
 
     def camera(self, bcam):
         bpy.ops.object.add(type='CAMERA')
-        b_obj = self._ctx.object
+        b_obj = self._created_data('objects', self._ctx.object)
+        self._created_data('cameras', b_obj.data)
         b_obj.name = self.name(bcam.original, id(bcam))
         b_obj.matrix_world = Matrix(bcam.matrix)
         b_cam = b_obj.data
@@ -115,7 +265,7 @@ class ColladaImport(object):
             mat = matnode.target
             b_matname = self.name(mat)
             if b_matname not in bpy.data.materials:
-                b_matname = self.material(mat, b_matname)
+                b_matname = self.material_merged(mat, b_matname)
             b_materials[sym] = bpy.data.materials[b_matname]
 
         primitives = bgeom.original.primitives
@@ -142,7 +292,8 @@ class ColladaImport(object):
             if not b_mesh:
                 continue
 
-            b_obj = bpy.data.objects.new(b_meshname, b_mesh)
+            b_obj = self._created_data('objects',
+                    bpy.data.objects.new(b_meshname, b_mesh))
             b_obj.data = b_mesh
 
             self._ctx.scene.objects.link(b_obj)
@@ -161,7 +312,9 @@ class ColladaImport(object):
                 bpy.ops.object.mode_set(mode='OBJECT')
 
             b_geoms.append(b_obj)
+            self._profile.count('geometry', objects=1)
 
+        self.release(bgeom)
         return b_geoms
 
     def geometry_triangleset(self, triset, b_name, b_mat):
@@ -173,7 +326,7 @@ class ColladaImport(object):
                     not len(triset.vertex_index):
                 return
 
-            b_mesh = bpy.data.meshes.new(b_name)
+            b_mesh = self._created_data('meshes', bpy.data.meshes.new(b_name))
             b_mesh.vertices.add(len(triset.vertex))
             b_mesh.tessfaces.add(len(triset))
 
@@ -206,6 +359,8 @@ class ColladaImport(object):
                             b_mat)
 
             b_mesh.update()
+            self._profile.count('geometry',
+                    vertices=len(triset.vertex), faces=len(triset))
             return b_mesh
 
     def texcoord_layer(self, triset, texcoord, index, b_mesh, b_mat):
@@ -226,18 +381,23 @@ class ColladaImport(object):
         b_name = self.name(light.original, i)
         if b_name not in bpy.data.lamps:
             if isinstance(light.original, DirectionalLight):
-                b_lamp = bpy.data.lamps.new(b_name, type='SUN')
+                b_lamp = self._created_data('lamps',
+                        bpy.data.lamps.new(b_name, type='SUN'))
             elif isinstance(light.original, PointLight):
-                b_lamp = bpy.data.lamps.new(b_name, type='POINT')
-                b_obj = bpy.data.objects.new(b_name, b_lamp)
+                b_lamp = self._created_data('lamps',
+                        bpy.data.lamps.new(b_name, type='POINT'))
+                b_obj = self._created_data('objects',
+                        bpy.data.objects.new(b_name, b_lamp))
                 self._ctx.scene.objects.link(b_obj)
                 b_obj.matrix_world = Matrix.Translation(light.position)
             elif isinstance(light.original, SpotLight):
-                b_lamp = bpy.data.lamps.new(b_name, type='SPOT')
+                b_lamp = self._created_data('lamps',
+                        bpy.data.lamps.new(b_name, type='SPOT'))
 
     def material(self, mat, b_name):
         effect = mat.effect
-        b_mat = bpy.data.materials.new(b_name)
+        b_mat = self._created_data('materials',
+                bpy.data.materials.new(b_name))
         b_name = b_mat.name
         b_mat.diffuse_shader = 'LAMBERT'
         getattr(self, 'rendering_' + \
@@ -250,9 +410,36 @@ class ColladaImport(object):
         self.rendering_reflectivity(effect, b_mat)
         return b_name
 
+    def material_merged(self, mat, b_name):
+        """ Creates Blender material, with ``merge_materials`` option
+        materials with identical effects share a single Blender material.
+        """
+        key = None
+        if self._kwargs.get('merge_materials', False):
+            key = self.effect_key(mat.effect)
+            if key in self._merged:
+                return self._merged[key]
+        with self._profile.phase('materials'):
+            b_name = self.material(mat, b_name)
+        self._profile.count('materials', materials=1)
+        if key is not None:
+            self._merged[key] = b_name
+        return b_name
+
+    def effect_key(self, effect):
+        """ Hashable summary of everything a material is built from. """
+        key = [effect.shadingtype]
+        for prop in Effect.supported:
+            value = getattr(effect, prop, None)
+            if isinstance(value, Map):
+                value = ('map', value.sampler.surface.image.path)
+            key.append(value)
+        return tuple(key)
+
     def node(self, node, parent):
         if isinstance(node, (Node, NodeNode)):
-            b_obj = bpy.data.objects.new(self.name(node), None)
+            b_obj = self._created_data('objects',
+                    bpy.data.objects.new(self.name(node), None))
             b_obj.matrix_world = Matrix(node.matrix)
             self._ctx.scene.objects.link(b_obj)
             if parent:
@@ -265,6 +452,18 @@ class ColladaImport(object):
                     b_obj.parent = parent
         return parent
 
+    def release(self, bgeom):
+        """ In low memory mode, drops COLLADA data of a geometry once
+        its last instance has been imported.
+        """
+        key = id(bgeom.original)
+        if key not in self._uses:
+            return
+        self._uses[key] -= 1
+        if self._uses[key] <= 0:
+            del self._uses[key]
+            _release_geometry(self._collada, bgeom.original)
+
     def rendering_blinn(self, mat, b_mat):
         effect = mat.effect
         b_mat.specular_shader = 'BLINN'
@@ -338,17 +537,48 @@ class ColladaImport(object):
 
     def try_texture(self, c_image, b_mat):
         mtex = None
-        with self._tmpwrite(c_image.path, c_image.data) as tmp:
+        image = self.image(c_image)
+        if image is not None:
+            texture = self._created_data('textures',
+                    bpy.data.textures.new(name='Kd', type='IMAGE'))
+            texture.image = image
+            mtex = b_mat.texture_slots.add()
+            mtex.texture_coords = 'UV'
+            mtex.texture = texture
+            self._images[b_mat.name] = image
+        return mtex
+
+    def image(self, c_image):
+        """ Loads and packs each COLLADA image just once, images shared
+        by several materials reuse the same Blender image.
+        """
+        if c_image.id in self._packed:
+            return self._packed[c_image.id]
+        with self._profile.phase('textures'), \
+                self._tmpwrite(c_image.path, c_image.data) as tmp:
             image = load_image(tmp)
             if image is not None:
+                self._created_data('images', image)
+                self.image_downscale(c_image, image)
                 image.pack(True)
-                texture = bpy.data.textures.new(name='Kd', type='IMAGE')
-                texture.image = image
-                mtex = b_mat.texture_slots.add()
-                mtex.texture_coords = 'UV'
-                mtex.texture = texture
-                self._images[b_mat.name] = image
-        return mtex
+                self._profile.count('textures', images=1)
+        self._packed[c_image.id] = image
+        return image
+
+    def image_downscale(self, c_image, image):
+        """ Scales image down to fit ``max_texture_size``, keeps original
+        absolute path and resolution as custom properties of the Blender
+        image.
+        """
+        width, height = image.size
+        image['collada_path'] = os.path.join(self._basedir, c_image.path)
+        image['collada_size'] = (width, height)
+        limit = self._kwargs.get('max_texture_size', 0)
+        if limit and max(width, height) > limit:
+            factor = float(limit) / max(width, height)
+            image.scale(
+                    max(1, int(width * factor)),
+                    max(1, int(height * factor)))
 
     def name(self, obj, index=0):
         """ Trying to get efficient and human readable name, workarounds
@@ -365,6 +595,28 @@ class ColladaImport(object):
             self._names[base] = '%s-%.4d' % (base[:MAX_NAME_LENGTH], self._namecount)
         return self._names[base]
 
+    def remove_created(self, ctx):
+        """ Removes all datablocks created by this importer. """
+        for attr in DATABLOCKS:
+            collection = getattr(bpy.data, attr)
+            for kind, b_data in reversed(self._created):
+                if kind != attr:
+                    continue
+                try:
+                    if attr == 'objects' and \
+                            b_data.name in ctx.scene.objects:
+                        ctx.scene.objects.unlink(b_data)
+                    collection.remove(b_data)
+                except ReferenceError:
+                    # already removed by the user
+                    pass
+        self._created = []
+
+    def _created_data(self, attr, b_data):
+        """ Remembers datablock created in `bpy.data` collection `attr`. """
+        self._created.append((attr, b_data))
+        return b_data
+
     @contextmanager
     def _tmpwrite(self, relpath, data):
         with NamedTemporaryFile(suffix='.' + relpath.split('.')[-1]) as out:
@@ -409,6 +661,11 @@ class SketchUpImport(ColladaImport):
     def rendering_phong(self, mat, b_mat):
         super().rendering_lambert(mat, b_mat)
 
+    def effect_key(self, effect):
+        """ GOOGLEEARTH extras disable reflectivity. """
+        return ColladaImport.effect_key(self, effect) + \
+                (bool(self.__class__.test2(effect.xmlnode)),)
+
     def rendering_reflectivity(self, effect, b_mat):
         """ There are no reflectivity controls in SketchUp """
         if not self.__class__.test2(effect.xmlnode):
@@ -452,6 +709,86 @@ def _eekadoodle_face(v1, v2, v3):
     return v3 == 0 and (v3, v1, v2, 0) or (v1, v2, v3, 0)
 
 
+def _grouped(bgeoms):
+    """ Orders bound geometries so all instances of the same geometry
+    follow each other and it can be released right after the last one.
+    The given list is emptied, bound geometries are dropped as they are
+    consumed.
+    """
+    groups = OrderedDict()
+    for bgeom in bgeoms:
+        groups.setdefault(id(bgeom.original), []).append(bgeom)
+    del bgeoms[:]
+    bgeom = None
+    while groups:
+        group = groups.popitem(last=False)[1]
+        group.reverse()
+        while group:
+            yield group.pop()
+
+
+def _release_geometry(collada, geom):
+    """ Drops source arrays, primitives and XML subtree of a geometry.
+    Works with both lxml and xml.etree backends of pycollada.
+    Containers are emptied in place, bound geometries share them.
+    """
+    for prim in geom.primitives:
+        prim.sources.clear()
+    del geom.primitives[:]
+    geom.sourceById.clear()
+    xml = geom.xmlnode
+    if xml is not None:
+        library = collada.xmlnode.getroot().find(tag('library_geometries'))
+        if library is not None:
+            try:
+                library.remove(xml)
+            except ValueError:
+                pass
+        xml.clear()
+
+
+def _memory(phase):
+    """ Current and peak resident set size at the end of import phase. """
+    return phase, _rss(), _peak_rss()
+
+
+def _rss():
+    """ Current resident set size of the process in megabytes. """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1048576.0
+    except (IOError, OSError, ValueError, AttributeError):
+        pass
+    if psutil is not None:
+        return psutil.Process().memory_info().rss / 1048576.0
+
+
+def _peak_rss():
+    """ Peak resident set size of the process in megabytes. Process-wide,
+    so it may come from before the import started.
+    """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        # bytes on macOS, kilobytes elsewhere
+        rss /= 1024.0
+    return rss / 1024.0
+
+
+def _increase(value, baseline):
+    if value is None or baseline is None:
+        return None
+    return value - baseline
+
+
+def _mb(value):
+    if value is None:
+        return 'n/a'
+    return '%.1f MB' % value
+
+
 def _children(node):
     if isinstance(node, Scene):
         return node.nodes
@@ -466,10 +803,13 @@ def _children(node):
 def _dfs(node, cb, parent=None):
     """ Depth first search taking a callback function.
     Its return value will be passed recursively as a parent argument.
+    Generator yielding after each callback.
 
     :param node: COLLADA node
     :param callable cb:
      """
     parent = cb(node, parent)
+    yield node
     for child in _children(node):
-        _dfs(child, cb, parent)
+        for descendant in _dfs(child, cb, parent):
+            yield descendant
@@ -0,0 +1,86 @@
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+__all__ = ['Profile', 'clock']
+
+clock = getattr(time, 'perf_counter', time.time)
+
+
+class Profile(object):
+    """ Collects wall time and counters of import/export phases.
+
+    Time spent in a nested phase is accounted to that phase only, so the
+    phase times add up to the total time of the profiled code. Disabled
+    profile does nothing and costs next to nothing.
+    """
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.phases = OrderedDict()
+        self._stack = []
+
+    @classmethod
+    def from_options(cls, use_profile=False, profile_path='', **kwargs):
+        """ Profile enabled by ``use_profile`` operator option or by a
+        ``profile_path`` to write it to.
+        """
+        return cls(bool(use_profile or profile_path))
+
+    @contextmanager
+    def phase(self, name):
+        if not self.enabled:
+            yield
+            return
+        stats = self._stats(name)
+        self._stack.append(0.0)
+        start = clock()
+        try:
+            yield
+        finally:
+            elapsed = clock() - start
+            nested = self._stack.pop()
+            stats['time'] += elapsed - nested
+            stats['calls'] += 1
+            if self._stack:
+                self._stack[-1] += elapsed
+
+    def count(self, name, **counters):
+        """ Adds counters, e.g. ``objects=1``, to the given phase. """
+        if not self.enabled:
+            return
+        stats = self._stats(name)
+        for key, value in counters.items():
+            stats[key] = stats.get(key, 0) + value
+
+    def total(self):
+        return sum(stats['time'] for stats in self.phases.values())
+
+    def summary(self):
+        parts = []
+        for name, stats in self.phases.items():
+            counters = ', '.join('%d %s' % (value, key)
+                    for key, value in stats.items()
+                    if key not in ('time', 'calls'))
+            part = '%s %.3fs' % (name, stats['time'])
+            if counters:
+                part += ' (%s)' % counters
+            parts.append(part)
+        return 'total %.3fs: %s' % (self.total(), '; '.join(parts))
+
+    def report(self, op, title):
+        if self.enabled:
+            op.report({'INFO'}, '%s %s' % (title, self.summary()))
+
+    def write(self, path):
+        with open(path, 'w') as out:
+            json.dump({
+                'total': self.total(),
+                'phases': self.phases,
+                }, out, indent=2)
+
+    def _stats(self, name):
+        if name not in self.phases:
+            self.phases[name] = OrderedDict([('time', 0.0), ('calls', 0)])
+        return self.phases[name]